@@ -1,4 +1,4 @@
-from drtv_dl.main import download
+from drtv_dl.main import download, enqueue, extract_info, plan, watch, work
 
 __version__ = "0.1.0"
-__all__ = ['download', '__version__']
\ No newline at end of file
+__all__ = ['download', 'enqueue', 'extract_info', 'plan', 'watch', 'work', '__version__']
\ No newline at end of file
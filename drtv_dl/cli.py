@@ -1,23 +1,128 @@
+import sys
 import argparse
 
 from drtv_dl.logger import logger
-from drtv_dl.main import download
+from drtv_dl.main import download, enqueue, extract_info, plan, watch, work
 from drtv_dl.exceptions import DRTVDownloaderError
+from drtv_dl.utils.merger import MergeService
+
+def ionice_type(value):
+    try:
+        MergeService.parse_ionice(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Download videos from DR TV")
-    parser.add_argument("url", help="URL of the video to download")
-    parser.add_argument("--resolution", default="360p", help="Desired video resolution (e.g., 1080p, 720p)")
+    parser.add_argument("url", nargs="?", help="URL of the video to download")
+    parser.add_argument("--resolution", default="360p", help="Desired video resolution (e.g., 1080p, 720p), or a comma-separated list to keep several")
     parser.add_argument("--include-subs", action="store_true", help="Download with subtitles")
     parser.add_argument("--ntmpl", help="User-custom naming template i.e. \"{title} E{episode_number} {year} [{id}]\"")
     parser.add_argument("--proxy", default=None,help="Proxy to use for the download")
     parser.add_argument("--list-formats", action="store_true", help="List available formats")
     parser.add_argument("--suppress-output", action="store_true", help="Suppress output to the screen")
     parser.add_argument("--log-level", default="INFO", help="Set the logging level")
+    parser.add_argument("--output-dir", default=None, help="Directory for finished files (defaults to the current directory)")
+    parser.add_argument("--temp-dir", default=None, help="Scratch directory for downloads and merging (defaults to the output directory)")
+    parser.add_argument("--verify", choices=["none", "fast", "deep"], default="fast", help="Verification level for downloaded tracks and merged files")
+    parser.add_argument("--connections", type=int, default=None, help="Parallel range requests per large track")
+    parser.add_argument("--merge-workers", type=int, default=None, help="Number of ffmpeg merges to run in parallel")
+    parser.add_argument("--merge-nice", type=int, default=None, help="CPU niceness for ffmpeg merges")
+    parser.add_argument("--merge-ionice", type=ionice_type, default=None, help="IO class for ffmpeg merges: idle, best-effort[:level] or realtime[:level]")
+    parser.add_argument("--merge-timeout", type=float, default=None, help="Seconds before a merge is aborted")
+    parser.add_argument("--dump-json", action="store_true", help="Write episode metadata as JSON Lines to stdout instead of downloading")
+    parser.add_argument("--with-renditions", action="store_true", help="Include the parsed m3u8 renditions in --dump-json output")
+    parser.add_argument("--plan", action="store_true", help="Report download size, estimated time and disk space without downloading")
+    parser.add_argument("--watch", action="store_true", help="Keep polling a series or season URL and download new episodes")
+    parser.add_argument("--watch-interval", type=float, default=3600, help="Seconds between polls in watch mode")
+    parser.add_argument("--watch-max-interval", type=float, default=6 * 3600, help="Upper bound for the poll interval when nothing changes")
+    parser.add_argument("--queue", default=None, help="Path to a shared SQLite job queue")
+    parser.add_argument("--enqueue", action="store_true", help="Expand the URL into episode jobs and add them to the queue")
+    parser.add_argument("--worker", action="store_true", help="Download jobs from the queue until it is empty")
+    parser.add_argument("--lease-timeout", type=float, default=300, help="Seconds before a job held by an unresponsive worker is reassigned")
     args = parser.parse_args()
 
+    if (args.enqueue or args.worker) and not args.queue:
+        parser.error("--enqueue and --worker require --queue")
+    if not args.url and not args.worker:
+        parser.error("the following arguments are required: url")
+
     logger.setLevel(args.log_level.upper())
-    
+
+    if args.enqueue:
+        enqueue(
+            url=args.url,
+            queue_path=args.queue,
+            proxy=args.proxy,
+            suppress_output=args.suppress_output
+        )
+        return
+
+    if args.worker:
+        work(
+            queue_path=args.queue,
+            resolution=args.resolution,
+            include_subs=args.include_subs,
+            ntmpl=args.ntmpl,
+            proxy=args.proxy,
+            suppress_output=args.suppress_output,
+            temp_dir=args.temp_dir,
+            output_dir=args.output_dir,
+            verify=args.verify,
+            connections=args.connections,
+            merge_workers=args.merge_workers,
+            merge_nice=args.merge_nice,
+            merge_ionice=args.merge_ionice,
+            merge_timeout=args.merge_timeout,
+            lease_timeout=args.lease_timeout
+        )
+        return
+
+    if args.dump_json:
+        extract_info(
+            url=args.url,
+            include_renditions=args.with_renditions,
+            proxy=args.proxy,
+            suppress_output=args.suppress_output,
+            output=sys.stdout
+        )
+        return
+
+    if args.plan:
+        plan(
+            url=args.url,
+            resolution=args.resolution,
+            include_subs=args.include_subs,
+            ntmpl=args.ntmpl,
+            proxy=args.proxy,
+            suppress_output=args.suppress_output,
+            temp_dir=args.temp_dir,
+            output_dir=args.output_dir
+        )
+        return
+
+    if args.watch:
+        watch(
+            url=args.url,
+            resolution=args.resolution,
+            include_subs=args.include_subs,
+            ntmpl=args.ntmpl,
+            proxy=args.proxy,
+            suppress_output=args.suppress_output,
+            temp_dir=args.temp_dir,
+            output_dir=args.output_dir,
+            verify=args.verify,
+            connections=args.connections,
+            merge_workers=args.merge_workers,
+            merge_nice=args.merge_nice,
+            merge_ionice=args.merge_ionice,
+            merge_timeout=args.merge_timeout,
+            interval=args.watch_interval,
+            max_interval=args.watch_max_interval
+        )
+        return
+
     download(
         url=args.url, 
         resolution=args.resolution,
@@ -25,7 +130,15 @@ def parse_args():
         ntmpl=args.ntmpl,
         proxy=args.proxy,
         list_formats=args.list_formats,
-        suppress_output=args.suppress_output
+        suppress_output=args.suppress_output,
+        temp_dir=args.temp_dir,
+        output_dir=args.output_dir,
+        verify=args.verify,
+        connections=args.connections,
+        merge_workers=args.merge_workers,
+        merge_nice=args.merge_nice,
+        merge_ionice=args.merge_ionice,
+        merge_timeout=args.merge_timeout
     )
 
 
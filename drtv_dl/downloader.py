@@ -1,28 +1,53 @@
 import os
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from drtv_dl.logger import logger
-from drtv_dl.utils.merger import Merger
+from drtv_dl.planner import DownloadPlanner
+from drtv_dl.utils.merger import MergeService
 from drtv_dl.utils import settings
 from drtv_dl.utils.m3u8_parser import M3U8Parser
 from drtv_dl.utils.progress_tracker import ProgressTracker
+from drtv_dl.utils.verifier import Verifier
+from drtv_dl.utils.writer import ParallelFileWriter, release_page_cache
+from drtv_dl.utils.scratch import (
+    get_scratch_dir,
+    get_resume_filename,
+    finalize_file,
+    preallocate,
+)
 from drtv_dl.utils.helpers import (
     generate_filename,
     download_webpage,
     vtt_to_srt,
     get_optimal_format,
-    get_optimal_stream,
+    get_optimal_streams,
+    parse_resolutions,
+    generate_resolution_filenames,
     print_formats,
     print_to_screen,
     delete_files,
 )
 from drtv_dl.exceptions import (
-    DownloadError, 
-    MergeError
+    MergeError,
+    VerificationError,
 )
 
 class DRTVDownloader:
+    TRACK_ATTEMPTS = 3
+    RANGED_DOWNLOAD_MIN_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, background_merges=False):
+        self.planner = DownloadPlanner()
+        self.verifier = Verifier(settings.VERIFY_LEVEL)
+        self.merge_service = MergeService.from_settings()
+        self.background_merges = background_merges
+        self._pending_merges = []
+
     def download(self, info, list_formats, resolution, include_subs, ntmpl):
+        # a merge that failed in the background stops the run before the next episode is fetched
+        self._raise_failed_merges()
         base_filename = generate_filename(info, ntmpl)
 
         stream_url = get_optimal_format(info.get('formats', [])).get('url')
@@ -33,40 +58,138 @@ class DRTVDownloader:
             print_formats(parsed_m3u8_streams)
             return
         
-        if self._check_if_downloaded(base_filename):
+        resolutions = parse_resolutions(resolution)
+        available_streams = get_optimal_streams(
+            parsed_m3u8_streams,
+            generate_resolution_filenames(base_filename, resolutions),
+            include_subs
+        )
+        optimal_streams = {
+            filename: optimal_stream
+            for filename, optimal_stream in available_streams.items()
+            if not self._check_if_downloaded(filename, info)
+        }
+        if optimal_streams:
+            episode_plan = self.planner.plan_streams(info, base_filename, optimal_streams)
+            scratch_dir = get_scratch_dir()
+            self.planner.admit(episode_plan, scratch_dir, settings.get_output_dir(), reserved=self._get_reserved_space())
+
+            track_filenames = self._download_tracks(
+                episode_plan['tracks'],
+                scratch_dir,
+                info.get('duration'),
+                parallel=len(episode_plan['outputs']) > 1
+            )
+            merge_job = self.merge_service.submit(self._merge_outputs, info, episode_plan, track_filenames, scratch_dir)
+            self._pending_merges.append((merge_job, episode_plan['output_size']))
+            if not self.background_merges:
+                self.wait_for_merges()
+
+        output_paths = [self._get_output_filename(filename) for filename in available_streams]
+        return output_paths[0] if len(resolutions) == 1 else output_paths
+
+    def wait_for_merges(self):
+        pending_merges, self._pending_merges = self._pending_merges, []
+        errors = []
+        for merge_job, _ in pending_merges:
+            try:
+                merge_job.result()
+            except Exception as e:
+                errors.append(e)
+        self._raise_merge_errors(errors)
+
+    def close(self):
+        self.merge_service.shutdown()
+
+    def _raise_failed_merges(self):
+        finished = [entry for entry in self._pending_merges if entry[0].done()]
+        if not finished:
             return
+        self._pending_merges = [entry for entry in self._pending_merges if entry not in finished]
+        self._raise_merge_errors([merge_job.exception() for merge_job, _ in finished if merge_job.exception()])
 
-        optimal_stream = get_optimal_stream(parsed_m3u8_streams, resolution, include_subs)
-        video_filename = self._download_stream(optimal_stream['video'], base_filename, stream_type='video')
-        audio_filename = self._download_stream(optimal_stream['audio'], base_filename, stream_type='audio')
-        subtitle_filename = self._download_subtitle(optimal_stream, base_filename, include_subs)
-
-        self._merge_streams(info, video_filename, audio_filename, subtitle_filename, base_filename)
-        self._cleanup(video_filename, audio_filename, subtitle_filename)
-
-    def _download_stream(self, stream, base_filename, stream_type):
-        m3u8 = download_webpage(url=stream['uri'])
-        map_uri = M3U8Parser.extract_map_uri(m3u8, stream['uri'])
-        if map_uri:
-            filename = f"{base_filename}.{stream_type}"
-            self._download_file(map_uri, filename, note=f"{stream_type.capitalize()} saved as {filename}")
-            return filename
-        else:
-            logger.error(f"Could not find {stream_type} MAP URI")
-            raise DownloadError(f"Could not find {stream_type} MAP URI")
-
-    def _download_subtitle(self, optimal_stream, base_filename, include_subs):
-        if include_subs and optimal_stream['subtitle']:
-            subtitle_url = optimal_stream['subtitle']['uri']
-            vtt_filename = f"{base_filename}.vtt"
-            self._download_file(subtitle_url, vtt_filename, note=f"Subtitles saved as {vtt_filename}")
-            
-            srt_filename = f"{base_filename}.srt"
-            vtt_to_srt(vtt_filename, srt_filename)
-            os.remove(vtt_filename)
-            return srt_filename
+    @staticmethod
+    def _raise_merge_errors(errors):
+        if len(errors) == 1:
+            raise errors[0]
+        if errors:
+            raise MergeError(f"{len(errors)} merges failed: " + "; ".join(str(e) for e in errors))
+
+    def _get_reserved_space(self):
+        # merges still running will grow their outputs in scratch after admission
+        return sum(output_size for merge_job, output_size in self._pending_merges if not merge_job.done())
+
+    def _merge_outputs(self, info, episode_plan, track_filenames, scratch_dir):
+        # renditions share their tracks, so one failed merge must not cost the others theirs
+        errors = []
+        try:
+            for output in episode_plan['outputs']:
+                try:
+                    self._merge_streams(
+                        info,
+                        track_filenames[output['video']['uri']],
+                        track_filenames[output['audio']['uri']],
+                        track_filenames[output['subtitle']['uri']] if output['subtitle'] else None,
+                        os.path.join(scratch_dir, output['filename']),
+                        output['filename']
+                    )
+                except Exception as e:
+                    logger.error(f"{output['filename']}: {e}")
+                    errors.append(e)
+        finally:
+            self._cleanup(*track_filenames.values())
+
+        if len(errors) == 1:
+            raise errors[0]
+        if errors:
+            raise MergeError(f"{len(errors)} renditions of {info['id']} failed: " + "; ".join(str(e) for e in errors))
+
+    def _download_tracks(self, tracks, scratch_dir, expected_duration, parallel):
+        if not parallel:
+            return {track['uri']: self._download_track(track, scratch_dir, expected_duration) for track in tracks}
+
+        # several renditions: fetch everything at once, the shared tracks only once
+        print_to_screen(f"Downloading {len(tracks)} tracks in parallel")
+        with ThreadPoolExecutor(max_workers=len(tracks)) as executor:
+            futures = {
+                track['uri']: executor.submit(self._download_track, track, scratch_dir, expected_duration, show_progress=False)
+                for track in tracks
+            }
+            return {uri: future.result() for uri, future in futures.items()}
+
+    def _download_track(self, track, scratch_dir, expected_duration, show_progress=True):
+        filename = os.path.join(scratch_dir, track['filename'])
+        for attempt in range(1, self.TRACK_ATTEMPTS + 1):
+            try:
+                if track['type'] == 'subtitle':
+                    return self._download_subtitle(track, filename, show_progress)
+                self._download_stream(track, filename, show_progress)
+            except (VerificationError, requests.RequestException) as e:
+                # a dropped connection is just another broken copy of this track
+                logger.warning(f"{filename}: {e}")
+            else:
+                if self.verifier.verify_track(filename, track, expected_duration):
+                    return filename
+            print_to_screen(
+                f"{track['type'].capitalize()} track failed "
+                f"(attempt {attempt} of {self.TRACK_ATTEMPTS})",
+                level='warning'
+            )
+        raise VerificationError(f"{track['type'].capitalize()} track failed after {self.TRACK_ATTEMPTS} attempts: {filename}")
+
+    def _download_stream(self, track, filename, show_progress=True):
+        stream_type = track['type']
+        self._download_file(track['uri'], filename, note=f"{stream_type.capitalize()} saved as {filename}", show_progress=show_progress)
+        return filename
+
+    def _download_subtitle(self, track, base_filename, show_progress=True):
+        vtt_filename = f"{base_filename}.vtt"
+        self._download_file(track['uri'], vtt_filename, note=f"Subtitles saved as {vtt_filename}", show_progress=show_progress)
         
-        return None
+        srt_filename = f"{base_filename}.srt"
+        vtt_to_srt(vtt_filename, srt_filename)
+        os.remove(vtt_filename)
+        return srt_filename
     
     @staticmethod
     def _download_m3u8_manifest(stream_url):
@@ -76,49 +199,194 @@ class DRTVDownloader:
         )
 
     @staticmethod
-    def _check_if_downloaded(base_filename):
-        if os.path.exists(base_filename + ".mp4"):
-            print_to_screen(f"{base_filename} is already downloaded")
-            return True
-        return False
+    def _get_output_filename(base_filename):
+        return os.path.join(settings.get_output_dir(), f"{base_filename}.mp4")
 
-    @staticmethod
-    def _download_file(url, filename, note):
+    def _check_if_downloaded(self, base_filename, info):
+        output_filename = self._get_output_filename(base_filename)
+        if not os.path.exists(output_filename):
+            return False
+        if self.verifier.level != 'none' and not self.verifier.is_trusted(output_filename):
+            if not self.verifier.verify_output(output_filename, info.get('duration')):
+                print_to_screen(f"{base_filename} failed verification, downloading it again", level='warning')
+                return False
+            self.verifier.record(output_filename)
+        print_to_screen(f"{base_filename} is already downloaded")
+        return True
+
+    def _download_file(self, url, filename, note, show_progress=True):
         response = requests.get(url, stream=True, proxies=settings.PROXY)
         response.raise_for_status()
         
-        initial_size = int(response.headers.get('content-length', None))
-        progress_tracker = ProgressTracker(initial_size, filename)
+        initial_size = int(response.headers.get('content-length', 0))
+        progress_tracker = ProgressTracker(initial_size, filename) if show_progress else None
         
         print_to_screen(f"Destination: {filename}")
+        written = None
+        if (
+            settings.DOWNLOAD_CONNECTIONS > 1
+            and initial_size >= DRTVDownloader.RANGED_DOWNLOAD_MIN_SIZE
+            and response.headers.get('accept-ranges') == 'bytes'
+        ):
+            response.close()
+            if not DRTVDownloader._download_file_ranges(url, filename, initial_size, progress_tracker):
+                logger.warning(f"{filename}: Server ignored the range requests, downloading sequentially")
+                response = requests.get(url, stream=True, proxies=settings.PROXY)
+                response.raise_for_status()
+                progress_tracker = ProgressTracker(initial_size, filename) if show_progress else None
+                written = DRTVDownloader._write_response(response, filename, initial_size, progress_tracker)
+        else:
+            written = DRTVDownloader._write_response(response, filename, initial_size, progress_tracker)
+        
+        if progress_tracker:
+            progress_tracker.finish()
+
+        # Content-Length counts the encoded bytes, so it cannot be compared once requests has decoded them
+        if (
+            self.verifier.level != 'none'
+            and written is not None
+            and initial_size
+            and not response.headers.get('content-encoding')
+            and written != initial_size
+        ):
+            raise VerificationError(f"{filename}: Received {written} of {initial_size} bytes")
+
+        print_to_screen(note)
+
+    @staticmethod
+    def _write_response(response, filename, initial_size, progress_tracker):
+        written = 0
+        unsynced = 0
         with open(filename, 'wb') as file:
+            preallocated = preallocate(file, initial_size)
             for chunk in response.iter_content(chunk_size=8192):
                 size = file.write(chunk)
-                progress_tracker.update(size)
-        
-        progress_tracker.finish()
+                written += size
+                unsynced += size
+                if progress_tracker:
+                    progress_tracker.update(size)
+                # same bound as the ranged writer, so a single stream does not fill the page cache either
+                if unsynced >= ParallelFileWriter.SYNC_INTERVAL:
+                    file.flush()
+                    release_page_cache(file.fileno())
+                    unsynced = 0
+            if preallocated:
+                file.truncate()
+            file.flush()
+            release_page_cache(file.fileno())
+        return written
+
+    @staticmethod
+    def _download_file_ranges(url, filename, size, progress_tracker):
+        # the partial file lives outside the scratch directory so an interrupted run can be resumed
+        partial_filename = get_resume_filename(url, size)
+        writer = ParallelFileWriter(partial_filename, size)
+        progress_lock = threading.Lock()
+
+        def update_progress(chunk_size):
+            if progress_tracker:
+                with progress_lock:
+                    progress_tracker.update(chunk_size)
+
+        update_progress(size - writer.missing_bytes())
+        ranges_supported = True
+        try:
+            for _ in range(DRTVDownloader.TRACK_ATTEMPTS):
+                segments = DRTVDownloader._split_ranges(
+                    writer.missing_ranges(),
+                    settings.DOWNLOAD_CONNECTIONS,
+                    writer.block_size
+                )
+                if not segments:
+                    break
+                with ThreadPoolExecutor(max_workers=settings.DOWNLOAD_CONNECTIONS) as executor:
+                    futures = [
+                        executor.submit(DRTVDownloader._fetch_range, url, writer, start, end, update_progress)
+                        for start, end in segments
+                    ]
+                    for future in futures:
+                        try:
+                            ranges_supported = future.result() and ranges_supported
+                        except requests.RequestException as e:
+                            logger.warning(f"{filename}: Range request failed: {e}")
+                if not ranges_supported:
+                    break
+        finally:
+            writer.close()
+
+        if not ranges_supported:
+            delete_files(partial_filename, writer.extents_filename)
+            return False
+        if not writer.is_complete():
+            raise VerificationError(f"{filename}: {writer.missing_bytes()} of {size} bytes are missing")
+        finalize_file(partial_filename, filename)
+        return True
 
-        print_to_screen(note)
-    
     @staticmethod
-    def _merge_streams(info, video_filename, audio_filename, subtitle_filename, base_filename):
-        output_filename = f"{base_filename}.mp4"
-        result = Merger.merge(
+    def _fetch_range(url, writer, start, end, update_progress):
+        response = requests.get(
+            url,
+            headers={'Range': f'bytes={start}-{end - 1}'},
+            stream=True,
+            proxies=settings.PROXY
+        )
+        response.raise_for_status()
+        if response.status_code != 206:
+            response.close()
+            return False
+
+        block_size = writer.block_size
+        offset = start
+        marked = start
+        for chunk in response.iter_content(chunk_size=block_size):
+            chunk = chunk[:end - offset]
+            writer.write_at(offset, chunk)
+            offset += len(chunk)
+            update_progress(len(chunk))
+
+            # segments start on a block boundary, so whole blocks can be marked as they fill up
+            completed = offset if offset >= end else offset - offset % block_size
+            if completed > marked:
+                writer.mark_complete(marked, completed)
+                marked = completed
+            if offset >= end:
+                break
+        response.close()
+        return True
+
+    @staticmethod
+    def _split_ranges(ranges, connections, block_size):
+        total = sum(end - start for start, end in ranges)
+        if not total:
+            return []
+        segment_size = -(-total // connections)
+        segment_size = -(-segment_size // block_size) * block_size
+        segments = []
+        for start, end in ranges:
+            for segment_start in range(start, end, segment_size):
+                segments.append((segment_start, min(segment_start + segment_size, end)))
+        return segments
+    
+    def _merge_streams(self, info, video_filename, audio_filename, subtitle_filename, scratch_filename, base_filename):
+        merged_filename = f"{scratch_filename}.mp4"
+        output_filename = self._get_output_filename(base_filename)
+        result = self.merge_service.merge(
             video_filename,
             audio_filename,
             subtitle_filename,
-            output_filename,
+            merged_filename,
             note=f"{info['id']}: Merging streams into {output_filename}"
         )
         if not result:
             raise MergeError(f"Failed to merge streams for {info['id']}")
+        if not self.verifier.verify_output(merged_filename, info.get('duration')):
+            raise MergeError(f"Merged output for {info['id']} failed verification")
+        finalize_file(merged_filename, output_filename)
+        self.verifier.record(output_filename)
+        return output_filename
     
     @staticmethod
-    def _cleanup(video_filename, audio_filename, subtitle_filename):
-        delete_files(
-            video_filename, 
-            audio_filename, 
-            subtitle_filename
-        )
+    def _cleanup(*filenames):
+        delete_files(*filenames)
 
 
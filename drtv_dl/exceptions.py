@@ -29,4 +29,10 @@ class StreamNotFoundError(DRTVDownloaderError):
     pass
 
 class ProxyError(DRTVDownloaderError):
+    pass
+
+class InsufficientDiskSpaceError(DownloadError):
+    pass
+
+class VerificationError(DownloadError):
     pass
\ No newline at end of file
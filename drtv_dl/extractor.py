@@ -144,12 +144,18 @@ class SeasonInfoExtractor:
         print_to_screen(f"{season_id}: Downloading season JSON metadata")
         season_data = json.loads(download_webpage(
             url=self.SEASON_API_URL,
-            params={
-                **self.SEASON_API_PARAMS,
-                'path': f'/saeson/{display_id}_{season_id}'
-            },
+            params=self.get_page_params(display_id, season_id),
         ))
 
+        return self.parse_season_data(season_data)
+
+    def get_page_params(self, display_id, season_id):
+        return {
+            **self.SEASON_API_PARAMS,
+            'path': f'/saeson/{display_id}_{season_id}'
+        }
+
+    def parse_season_data(self, season_data):
         episodes = season_data.get('entries', [])[0].get('item', {}).get('episodes', {}).get('items', [])
         episode_urls = []
         for episode in episodes:
@@ -188,20 +194,24 @@ class SeriesInfoExtractor:
         print_to_screen(f"{series_id}: Downloading series JSON metadata")
         series_data = json.loads(download_webpage(
             url=self.SERIES_API_URL,
-            params={
-                **self.SERIES_API_PARAMS,
-                'path': f'/serie/{display_id}_{series_id}'
-            },
+            params=self.get_page_params(display_id, series_id),
         ))
 
-        seasons = series_data.get('entries', [])[0].get('item', {}).get('show', {}).get('seasons', {}).get('items', [])
         season_info = []
-        for season in seasons:
-            season_path = season.get('path')
-            season_url = urljoin(self.BASE_URL, season_path)
+        for season_url in self.parse_season_urls(series_data):
             print_to_screen(f"Processing season: {season_url}")
             season = self.season_extractor.extract(season_url)
             season_info.append(season)
 
         print_to_screen(f"Total seasons found: {len(season_info)}")
-        return season_info
\ No newline at end of file
+        return season_info
+
+    def get_page_params(self, display_id, series_id):
+        return {
+            **self.SERIES_API_PARAMS,
+            'path': f'/serie/{display_id}_{series_id}'
+        }
+
+    def parse_season_urls(self, series_data):
+        seasons = series_data.get('entries', [])[0].get('item', {}).get('show', {}).get('seasons', {}).get('items', [])
+        return [urljoin(self.BASE_URL, season.get('path')) for season in seasons]
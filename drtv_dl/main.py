@@ -1,6 +1,24 @@
+import os
+import json
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
 from drtv_dl.downloader import DRTVDownloader
-from drtv_dl.exceptions import InvalidURLError
-from drtv_dl.utils.settings import set_suppress_output, set_proxy
+from drtv_dl.planner import DownloadPlanner
+from drtv_dl.watcher import Watcher
+from drtv_dl.work_queue import WorkQueue, QueueWorker
+from drtv_dl.exceptions import InvalidURLError, DRTVDownloaderError
+from drtv_dl.utils.m3u8_parser import M3U8Parser
+from drtv_dl.utils import settings
+from drtv_dl.utils.settings import (
+    set_suppress_output,
+    set_proxy,
+    set_temp_dir,
+    set_output_dir,
+    set_verify_level,
+    set_merge_options,
+    set_download_connections,
+)
 from drtv_dl.extractor import (
     InfoExtractor, 
     SeasonInfoExtractor, 
@@ -9,20 +27,21 @@ from drtv_dl.extractor import (
 from drtv_dl.utils.helpers import (
     print_to_screen, 
     is_valid_drtv_url,
+    download_webpage,
+    get_optimal_format,
 )
 
-def download(url, resolution="360p", include_subs=False, ntmpl=None, proxy=None, list_formats=False, suppress_output=False):
+def download(url, resolution="360p", include_subs=False, ntmpl=None, proxy=None, list_formats=False, suppress_output=False, temp_dir=None, output_dir=None, verify=None, connections=None, merge_workers=None, merge_nice=None, merge_ionice=None, merge_timeout=None):
     if not is_valid_drtv_url(url):
         raise InvalidURLError("URL was not found to be valid")
-    
-    if suppress_output:
-        set_suppress_output(suppress_output)
-    if proxy:
-        set_proxy(proxy)
+
+    _configure(proxy, suppress_output, temp_dir, output_dir, verify, connections)
+    set_merge_options(merge_workers, merge_nice, merge_ionice, merge_timeout)
 
     print_to_screen(f"Processing URL: {url}")
     ie = InfoExtractor()
     sie = SeasonInfoExtractor(ie)
+    downloader = DRTVDownloader(background_merges=True)
 
     if '/drtv/serie/' in url:
         print_to_screen("Identified as a series URL")
@@ -35,22 +54,188 @@ def download(url, resolution="360p", include_subs=False, ntmpl=None, proxy=None,
         extractor = ie
 
     info = extractor.extract(url)
-    downloader = DRTVDownloader()
 
-    if isinstance(info, dict) and 'episode_urls' in info:
-        print_to_screen(f"Starting download of season {info.get('season_number', '')}")
-        for idx, episode_url in enumerate(info['episode_urls'], start=1):
-            print_to_screen(f"Processing episode {idx} of {len(info['episode_urls'])}")
-            episode_info = ie.extract(episode_url)
-            downloader.download(episode_info, list_formats, resolution=resolution, include_subs=include_subs, ntmpl=ntmpl)
-    elif isinstance(info, list):
-        total_seasons = len(info)
-        for season_idx, season in enumerate(info, start=1):
-            print_to_screen(f"Processing season {season_idx} of {total_seasons}")
-            for idx, episode_url in enumerate(season['episode_urls'], start=1):
-                print_to_screen(f"Processing episode {idx} of {len(season['episode_urls'])} in season {season_idx} of {total_seasons}")
+    try:
+        if isinstance(info, dict) and 'episode_urls' in info:
+            print_to_screen(f"Starting download of season {info.get('season_number', '')}")
+            for idx, episode_url in enumerate(info['episode_urls'], start=1):
+                print_to_screen(f"Processing episode {idx} of {len(info['episode_urls'])}")
                 episode_info = ie.extract(episode_url)
                 downloader.download(episode_info, list_formats, resolution=resolution, include_subs=include_subs, ntmpl=ntmpl)
+        elif isinstance(info, list):
+            total_seasons = len(info)
+            for season_idx, season in enumerate(info, start=1):
+                print_to_screen(f"Processing season {season_idx} of {total_seasons}")
+                for idx, episode_url in enumerate(season['episode_urls'], start=1):
+                    print_to_screen(f"Processing episode {idx} of {len(season['episode_urls'])} in season {season_idx} of {total_seasons}")
+                    episode_info = ie.extract(episode_url)
+                    downloader.download(episode_info, list_formats, resolution=resolution, include_subs=include_subs, ntmpl=ntmpl)
+        else:
+            print_to_screen("Processing a single item")
+            downloader.download(info, list_formats, resolution=resolution, include_subs=include_subs, ntmpl=ntmpl)
+        downloader.wait_for_merges()
+    except Exception:
+        # merges of earlier episodes still run in the background, their failures must not go unreported
+        try:
+            downloader.wait_for_merges()
+        except Exception as e:
+            print_to_screen(f"Background merge failed: {e}", level='error')
+        raise
+    finally:
+        downloader.close()
+
+def plan(url, resolution="360p", include_subs=False, ntmpl=None, proxy=None, suppress_output=False, temp_dir=None, output_dir=None):
+    if not is_valid_drtv_url(url):
+        raise InvalidURLError("URL was not found to be valid")
+
+    _configure(proxy, suppress_output, temp_dir, output_dir)
+
+    print_to_screen(f"Planning URL: {url}")
+    ie = InfoExtractor()
+    sie = SeasonInfoExtractor(ie)
+    planner = DownloadPlanner()
+
+    episode_urls = _extract_episode_urls(url, ie, sie)
+    print_to_screen(f"Planning {len(episode_urls)} episodes")
+    episode_plans, unplanned = planner.plan_episodes(ie.extract, episode_urls, resolution, include_subs, ntmpl)
+
+    bandwidth = None
+    if episode_plans:
+        largest_track = max((track for plan in episode_plans for track in plan['tracks']), key=lambda track: track['size'] or 0)
+        print_to_screen("Measuring bandwidth")
+        bandwidth = planner.measure_bandwidth(largest_track['uri'])
+
+    summary = planner.summarize(episode_plans, settings.get_temp_dir(), settings.get_output_dir(), bandwidth, unplanned)
+    planner.print_summary(summary)
+    return {
+        **summary,
+        'plans': episode_plans,
+    }
+
+def extract_info(url, include_renditions=False, proxy=None, suppress_output=False, max_workers=8, output=None):
+    if not is_valid_drtv_url(url):
+        raise InvalidURLError("URL was not found to be valid")
+
+    _configure(proxy, suppress_output, None, None)
+
+    print_to_screen(f"Extracting metadata from URL: {url}")
+    ie = InfoExtractor()
+    sie = SeasonInfoExtractor(ie)
+    episode_urls = _extract_episode_urls(url, ie, sie)
+
+    infos = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for info in executor.map(lambda episode_url: _extract_episode_info(ie, episode_url, include_renditions), episode_urls):
+            if output is not None:
+                output.write(json.dumps(info, ensure_ascii=False) + "\n")
+                output.flush()
+            infos.append(info)
+    return infos
+
+def _extract_episode_info(ie, episode_url, include_renditions):
+    try:
+        info = ie.extract(episode_url)
+        if include_renditions:
+            stream_url = get_optimal_format(info.get('formats', [])).get('url')
+            info['renditions'] = M3U8Parser(stream_url, download_webpage(url=stream_url)).parse()
+    except (DRTVDownloaderError, requests.RequestException, ValueError) as e:
+        print_to_screen(f"Failed to extract {episode_url}: {e}", level='error')
+        return {'webpage_url': episode_url, 'error': str(e)}
+    return {'webpage_url': episode_url, **info}
+
+def enqueue(url, queue_path, proxy=None, suppress_output=False):
+    if not is_valid_drtv_url(url):
+        raise InvalidURLError("URL was not found to be valid")
+
+    _configure(proxy, suppress_output, None, None)
+
+    print_to_screen(f"Expanding URL into jobs: {url}")
+    ie = InfoExtractor()
+    sie = SeasonInfoExtractor(ie)
+    episode_urls = _extract_episode_urls(url, ie, sie)
+
+    queue = WorkQueue(queue_path)
+    added = queue.enqueue(episode_urls)
+    print_to_screen(f"Queued {added} new jobs ({len(episode_urls) - added} already queued)")
+    queue.print_stats()
+    return added
+
+def work(queue_path, resolution="360p", include_subs=False, ntmpl=None, proxy=None, suppress_output=False, temp_dir=None, output_dir=None, verify=None, connections=None, merge_workers=None, merge_nice=None, merge_ionice=None, merge_timeout=None, lease_timeout=300, worker_id=None):
+    _configure(proxy, suppress_output, temp_dir, output_dir, verify, connections)
+    set_merge_options(merge_workers, merge_nice, merge_ionice, merge_timeout)
+
+    ie = InfoExtractor()
+    downloader = DRTVDownloader()
+    worker = QueueWorker(
+        WorkQueue(queue_path, lease_timeout=lease_timeout),
+        ie,
+        downloader,
+        download_kwargs={
+            'resolution': resolution,
+            'include_subs': include_subs,
+            'ntmpl': ntmpl,
+        },
+        worker_id=worker_id
+    )
+    try:
+        return worker.run()
+    finally:
+        downloader.close()
+
+def _configure(proxy, suppress_output, temp_dir, output_dir, verify=None, connections=None):
+    if suppress_output:
+        set_suppress_output(suppress_output)
+    if proxy:
+        set_proxy(proxy)
+    if output_dir:
+        set_output_dir(output_dir)
+        os.makedirs(settings.get_output_dir(), exist_ok=True)
+    if temp_dir:
+        set_temp_dir(temp_dir)
+        os.makedirs(settings.get_temp_dir(), exist_ok=True)
+    if verify:
+        set_verify_level(verify)
+    if connections:
+        set_download_connections(connections)
+
+def _extract_episode_urls(url, ie, sie):
+    if '/drtv/serie/' in url:
+        print_to_screen("Identified as a series URL")
+        seasons = SeriesInfoExtractor(sie).extract(url)
+        return [episode_url for season in seasons for episode_url in season['episode_urls']]
+    elif '/drtv/saeson/' in url:
+        print_to_screen("Identified as a season URL")
+        return sie.extract(url)['episode_urls']
     else:
-        print_to_screen("Processing a single item")
-        downloader.download(info, list_formats, resolution=resolution, include_subs=include_subs, ntmpl=ntmpl)
+        print_to_screen("Identified as a single item URL")
+        return [url]
+
+def watch(url, resolution="360p", include_subs=False, ntmpl=None, proxy=None, suppress_output=False, temp_dir=None, output_dir=None, verify=None, connections=None, merge_workers=None, merge_nice=None, merge_ionice=None, merge_timeout=None, interval=3600, max_interval=6 * 3600):
+    if not is_valid_drtv_url(url):
+        raise InvalidURLError("URL was not found to be valid")
+    if '/drtv/serie/' not in url and '/drtv/saeson/' not in url:
+        raise InvalidURLError("Watch mode requires a series or season URL")
+
+    _configure(proxy, suppress_output, temp_dir, output_dir, verify, connections)
+    set_merge_options(merge_workers, merge_nice, merge_ionice, merge_timeout)
+
+    print_to_screen(f"Watching URL: {url}")
+    ie = InfoExtractor()
+    sie = SeasonInfoExtractor(ie)
+    downloader = DRTVDownloader()
+    watcher = Watcher(
+        ie,
+        sie,
+        downloader,
+        download_kwargs={
+            'resolution': resolution,
+            'include_subs': include_subs,
+            'ntmpl': ntmpl,
+        },
+        interval=interval,
+        max_interval=max_interval
+    )
+    try:
+        watcher.run(url)
+    finally:
+        downloader.close()
@@ -0,0 +1,238 @@
+import os
+import time
+import shutil
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from drtv_dl.logger import logger
+from drtv_dl.utils import settings
+from drtv_dl.utils.m3u8_parser import M3U8Parser
+from drtv_dl.utils.helpers import (
+    generate_filename,
+    download_webpage,
+    get_optimal_format,
+    get_optimal_streams,
+    parse_resolutions,
+    generate_resolution_filenames,
+    format_size,
+    print_to_screen,
+)
+from drtv_dl.exceptions import (
+    DRTVDownloaderError,
+    DownloadError,
+    InsufficientDiskSpaceError,
+)
+
+class DownloadPlanner:
+    BANDWIDTH_SAMPLE_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+
+    def plan_episode(self, info, resolution, include_subs, ntmpl):
+        base_filename = generate_filename(info, ntmpl)
+        stream_url = get_optimal_format(info.get('formats', [])).get('url')
+        parsed_m3u8_streams = M3U8Parser(stream_url, download_webpage(url=stream_url)).parse()
+        resolutions = parse_resolutions(resolution)
+        optimal_streams = get_optimal_streams(
+            parsed_m3u8_streams,
+            generate_resolution_filenames(base_filename, resolutions),
+            include_subs
+        )
+        return self.plan_streams(info, base_filename, optimal_streams)
+
+    def plan_episodes(self, extract, episode_urls, resolution, include_subs, ntmpl):
+        # whole episodes are planned concurrently so the MAP URI lookups and probes overlap across a series
+        def plan_url(episode_url):
+            try:
+                return self.plan_episode(extract(episode_url), resolution, include_subs, ntmpl), None
+            except (DRTVDownloaderError, requests.RequestException, ValueError) as e:
+                print_to_screen(f"Failed to plan {episode_url}: {e}", level='error')
+                return None, {'webpage_url': episode_url, 'error': str(e)}
+
+        episode_plans = []
+        unplanned = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for idx, (episode_plan, failure) in enumerate(executor.map(plan_url, episode_urls), start=1):
+                print_to_screen(f"Planned episode {idx} of {len(episode_urls)}")
+                if failure:
+                    unplanned.append(failure)
+                else:
+                    episode_plans.append(episode_plan)
+        return episode_plans, unplanned
+
+    def plan_streams(self, info, base_filename, optimal_streams):
+        tracks = []
+        outputs = []
+        tracks_by_uri = {}
+
+        def add_track(stream_type, stream):
+            if stream['uri'] not in tracks_by_uri:
+                tracks_by_uri[stream['uri']] = {'type': stream_type, 'stream': stream}
+                tracks.append(tracks_by_uri[stream['uri']])
+            return tracks_by_uri[stream['uri']]
+
+        # renditions of the same episode share their audio and subtitle tracks
+        for output_filename, optimal_stream in optimal_streams.items():
+            video_track = add_track('video', optimal_stream['video'])
+            video_track['filename'] = f"{output_filename}.video"
+            outputs.append({
+                'filename': output_filename,
+                'video': video_track,
+                'audio': add_track('audio', optimal_stream['audio']),
+                'subtitle': add_track('subtitle', optimal_stream['subtitle']) if optimal_stream.get('subtitle') else None,
+            })
+
+        audio_tracks = [track for track in tracks if track['type'] == 'audio']
+        for track in audio_tracks:
+            if len(audio_tracks) == 1:
+                track['filename'] = f"{base_filename}.audio"
+            else:
+                track['filename'] = f"{base_filename}.{track['stream']['group-id']}.audio"
+
+        media_tracks = [track for track in tracks if track['type'] != 'subtitle']
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for track, map_uri in zip(media_tracks, executor.map(self._resolve_map_uri, media_tracks)):
+                track['uri'] = map_uri
+
+        for track in tracks:
+            if track['type'] == 'subtitle':
+                track['uri'] = track['stream']['uri']
+                track['filename'] = base_filename
+
+        for track, size in zip(tracks, self.probe_sizes([track['uri'] for track in tracks])):
+            track['size'] = size
+
+        download_size = sum(track['size'] or 0 for track in tracks)
+        # the merged output is a remux, so it is roughly as large as its inputs
+        output_size = sum((output['video']['size'] or 0) + (output['audio']['size'] or 0) for output in outputs)
+        return {
+            'id': info['id'],
+            'base_filename': base_filename,
+            'tracks': tracks,
+            'outputs': outputs,
+            'download_size': download_size,
+            'output_size': output_size,
+            'required_space': download_size + output_size,
+            'complete': all(track['size'] is not None for track in tracks),
+        }
+
+    def probe_sizes(self, urls):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self._probe_size, urls))
+
+    def measure_bandwidth(self, url):
+        start_time = time.time()
+        response = requests.get(
+            url,
+            headers={'Range': f'bytes=0-{self.BANDWIDTH_SAMPLE_SIZE - 1}'},
+            stream=True,
+            proxies=settings.PROXY
+        )
+        response.raise_for_status()
+        received = 0
+        for chunk in response.iter_content(chunk_size=65536):
+            received += len(chunk)
+            if received >= self.BANDWIDTH_SAMPLE_SIZE:
+                break
+        response.close()
+        elapsed_time = time.time() - start_time
+        return received / elapsed_time if elapsed_time > 0 else None
+
+    @staticmethod
+    def admit(episode_plan, temp_dir, output_dir=None, reserved=0):
+        if not episode_plan['complete']:
+            logger.debug(f"{episode_plan['id']}: Some track sizes are unknown, admission is best effort")
+        for directory, required_space in DownloadPlanner._get_space_requirements(
+            temp_dir, output_dir, episode_plan['required_space'], episode_plan['output_size']
+        ):
+            free_space = shutil.disk_usage(directory).free - reserved
+            if required_space > free_space:
+                raise InsufficientDiskSpaceError(
+                    f"{episode_plan['id']}: Needs {format_size(required_space)} "
+                    f"but only {format_size(max(free_space, 0))} is free in {directory}"
+                )
+
+    @staticmethod
+    def summarize(episode_plans, temp_dir, output_dir=None, bandwidth=None, unplanned=None):
+        total_bytes = sum(plan['download_size'] for plan in episode_plans)
+        total_output = sum(plan['output_size'] for plan in episode_plans)
+        # only one episode's temporary files exist at a time, finished outputs accumulate
+        if output_dir is None or DownloadPlanner._is_same_device(temp_dir, output_dir):
+            peak_scratch = max((plan['download_size'] for plan in episode_plans), default=0) + total_output
+        else:
+            peak_scratch = max((plan['required_space'] for plan in episode_plans), default=0)
+        return {
+            'episodes': len(episode_plans),
+            'total_bytes': total_bytes,
+            'disk': [
+                {
+                    'directory': directory,
+                    'required_space': required_space,
+                    'free_space': shutil.disk_usage(directory).free,
+                }
+                for directory, required_space in DownloadPlanner._get_space_requirements(
+                    temp_dir, output_dir, peak_scratch, total_output
+                )
+            ],
+            'bandwidth': bandwidth,
+            'estimated_time': total_bytes / bandwidth if bandwidth else None,
+            'unknown_sizes': sum(1 for plan in episode_plans if not plan['complete']),
+            'unplanned': unplanned or [],
+        }
+
+    @staticmethod
+    def print_summary(summary):
+        print_to_screen(f"Episodes: {summary['episodes']}")
+        print_to_screen(f"Total download size: {format_size(summary['total_bytes'])}")
+        if summary['estimated_time'] is not None:
+            minutes, seconds = divmod(int(summary['estimated_time']), 60)
+            hours, minutes = divmod(minutes, 60)
+            print_to_screen(
+                f"Estimated time: {hours}:{minutes:02d}:{seconds:02d} "
+                f"at {summary['bandwidth'] / (1024 * 1024):.2f} MB/s"
+            )
+        for disk in summary['disk']:
+            print_to_screen(
+                f"Disk space needed in {disk['directory']}: {format_size(disk['required_space'])} "
+                f"({format_size(disk['free_space'])} free)"
+            )
+            if disk['required_space'] > disk['free_space']:
+                print_to_screen(f"Not enough disk space in {disk['directory']}", level='warning')
+        if summary['unknown_sizes']:
+            print_to_screen(f"{summary['unknown_sizes']} episodes have tracks of unknown size", level='warning')
+        if summary['unplanned']:
+            print_to_screen(f"{len(summary['unplanned'])} episodes could not be planned and are not included:", level='warning')
+            for failure in summary['unplanned']:
+                print_to_screen(f"  {failure['webpage_url']}: {failure['error']}", level='warning')
+
+    @staticmethod
+    def _get_space_requirements(temp_dir, output_dir, scratch_space, output_space):
+        if output_dir is None or DownloadPlanner._is_same_device(temp_dir, output_dir):
+            return [(temp_dir, scratch_space)]
+        return [(temp_dir, scratch_space), (output_dir, output_space)]
+
+    @staticmethod
+    def _is_same_device(first_dir, second_dir):
+        return os.stat(first_dir).st_dev == os.stat(second_dir).st_dev
+
+    @staticmethod
+    def _resolve_map_uri(track):
+        stream_type = track['type']
+        m3u8 = download_webpage(url=track['stream']['uri'])
+        map_uri = M3U8Parser.extract_map_uri(m3u8, track['stream']['uri'])
+        if not map_uri:
+            logger.error(f"Could not find {stream_type} MAP URI")
+            raise DownloadError(f"Could not find {stream_type} MAP URI")
+        return map_uri
+
+    @staticmethod
+    def _probe_size(url):
+        try:
+            response = requests.head(url, allow_redirects=True, proxies=settings.PROXY)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning(f"Could not probe size of {url}: {e}")
+            return None
+        content_length = response.headers.get('content-length')
+        return int(content_length) if content_length else None
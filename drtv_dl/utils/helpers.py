@@ -63,6 +63,28 @@ def download_webpage(url, headers=None, data=None, params=None, json=None):
     logger.debug(f"Received response from {url}")
     return response.text
 
+def download_webpage_conditional(url, etag=None, last_modified=None, headers=None, params=None):
+    headers = dict(headers or {})
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    logger.debug(f"Conditionally requesting URL: {url}")
+    response = requests.get(
+        url=url,
+        headers=headers,
+        params=params,
+        proxies=settings.PROXY
+    )
+    if response.status_code == 304:
+        logger.debug(f"Not modified: {url}")
+        return None, etag, last_modified
+
+    response.raise_for_status()
+    logger.debug(f"Received response from {url}")
+    return response.text, response.headers.get('ETag'), response.headers.get('Last-Modified')
+
 def extract_ids_from_url(url):
     path_parts = url.strip('/').split('/')
     last_part = path_parts[-1]
@@ -119,6 +141,30 @@ def get_optimal_stream(parsed_m3u8_streams, desired_resolution, include_subs):
 
         return optimal_stream
 
+def parse_resolutions(resolution):
+    if isinstance(resolution, str):
+        resolution = resolution.split(',')
+    return list(dict.fromkeys(r.strip() for r in resolution if r.strip()))
+
+def generate_resolution_filenames(base_filename, resolutions):
+    if len(resolutions) == 1:
+        return {resolutions[0]: base_filename}
+    return {resolution: f"{base_filename} [{resolution}]" for resolution in resolutions}
+
+def get_optimal_streams(parsed_m3u8_streams, resolution_filenames, include_subs):
+    optimal_streams = {}
+    for resolution, filename in resolution_filenames.items():
+        try:
+            optimal_streams[filename] = get_optimal_stream(parsed_m3u8_streams, resolution, include_subs)
+        except StreamNotFoundError as e:
+            if len(resolution_filenames) == 1:
+                raise
+            print_to_screen(f"{e}, skipping it", level='warning')
+
+    if not optimal_streams:
+        raise StreamNotFoundError(f"None of the resolutions {', '.join(resolution_filenames)} are available")
+    return optimal_streams
+
 def get_optimal_format(formats):
     if not formats:
         logger.error("No available formats to choose from")
@@ -186,6 +232,13 @@ def generate_filename(info, ntmpl):
 
     return sanitize_filename(filename)
 
+def format_size(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.2f} {unit}"
+        size /= 1024
+    return f"{size:.2f} TB"
+
 def delete_files(*file_paths):
     for file_path in file_paths:
         if not file_path:
@@ -1,46 +1,154 @@
 import ffmpeg
 import os
+import shutil
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
+from drtv_dl.utils import settings
 from drtv_dl.utils.helpers import print_to_screen
 from drtv_dl.logger import logger
 
 class Merger:
-    cwd = os.getcwd()
-    output_params = {'c:v': 'copy', 'c:a': 'copy'}
-
     def __init__(self, video_file, audio_file, subtitle_file, output_file):
-        self.video_file = os.path.join(self.cwd, video_file)
-        self.audio_file = os.path.join(self.cwd, audio_file)
-        self.subtitle_file = os.path.join(self.cwd, subtitle_file) if subtitle_file else None
-        self.output_file = os.path.join(self.cwd, output_file)
-    
+        self.video_file = os.path.abspath(video_file)
+        self.audio_file = os.path.abspath(audio_file)
+        self.subtitle_file = os.path.abspath(subtitle_file) if subtitle_file else None
+        self.output_file = os.path.abspath(output_file)
+        self.output_params = {'c:v': 'copy', 'c:a': 'copy'}
+
     def _get_input_streams(self):
         streams = [
             ffmpeg.input(self.video_file),
             ffmpeg.input(self.audio_file)
         ]
-        
+
         if self.subtitle_file:
             streams.append(ffmpeg.input(self.subtitle_file))
             self.output_params['c:s'] = 'mov_text'
-        
+
         return streams
 
-    def _merge_streams(self):
-        streams  = self._get_input_streams()
-        try:
-            ffmpeg.output(
-                *streams,
-                self.output_file,
-                **self.output_params
-            ).run(quiet=True, overwrite_output=True)
-            return True
-        except ffmpeg.Error as e:
-            logger.error(f"Error merging files: {str(e)}")
-            return False
-    
+    def build_command(self):
+        streams = self._get_input_streams()
+        return ffmpeg.output(
+            *streams,
+            self.output_file,
+            **self.output_params
+        ).global_args('-nostats', '-progress', 'pipe:1').compile(overwrite_output=True)
+
     @staticmethod
     def merge(video_file, audio_file, subtitle_file, output_file, note=None):
+        return MergeService.from_settings().merge(video_file, audio_file, subtitle_file, output_file, note=note)
+
+
+class MergeService:
+    IONICE_CLASSES = {'realtime': '1', 'best-effort': '2', 'idle': '3'}
+
+    def __init__(self, max_workers=None, nice=None, ionice=None, timeout=None):
+        # remuxing is mostly disk bound, so a few concurrent ffmpeg processes are enough
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) // 2))
+        self.nice = nice
+        # parsed up front so a bad value fails before anything is downloaded
+        self.ionice_args = self.parse_ionice(ionice) if ionice else None
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._executor = None
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            max_workers=settings.MERGE_WORKERS,
+            nice=settings.MERGE_NICE,
+            ionice=settings.MERGE_IONICE,
+            timeout=settings.MERGE_TIMEOUT
+        )
+
+    @classmethod
+    def parse_ionice(cls, value):
+        ionice_class, _, level = value.partition(':')
+        if ionice_class not in cls.IONICE_CLASSES:
+            raise ValueError(f"Unknown ionice class: {ionice_class}")
+        if level and ionice_class == 'idle':
+            raise ValueError("The idle ionice class takes no level")
+        if level and (not level.isdigit() or int(level) > 7):
+            raise ValueError(f"ionice level must be between 0 and 7, got {level}")
+        if ionice_class == 'realtime' and hasattr(os, 'geteuid') and os.geteuid() != 0:
+            raise ValueError("The realtime ionice class requires root")
+        return ['-c', cls.IONICE_CLASSES[ionice_class]] + (['-n', level] if level else [])
+
+    def merge(self, video_file, audio_file, subtitle_file, output_file, note=None):
         print_to_screen(note)
-        merger = Merger(video_file, audio_file, subtitle_file, output_file)
-        return merger._merge_streams()
+        command = self._get_priority_prefix() + Merger(video_file, audio_file, subtitle_file, output_file).build_command()
+        with self._slots:
+            return self._run(command, output_file)
+
+    def submit(self, fn, *args, **kwargs):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def _run(self, command, output_file):
+        logger.debug(f"Running: {' '.join(command)}")
+        try:
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                errors='replace'
+            )
+        except OSError as e:
+            logger.error(f"Error merging files: {e}")
+            return False
+
+        stderr_tail = deque(maxlen=20)
+        stderr_reader = threading.Thread(target=stderr_tail.extend, args=(process.stderr,), daemon=True)
+        stderr_reader.start()
+
+        timed_out = threading.Event()
+        timer = None
+        if self.timeout:
+            timer = threading.Timer(self.timeout, lambda: (timed_out.set(), process.kill()))
+            timer.start()
+
+        progress = {}
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            progress[key] = value
+            if key == 'progress':
+                logger.debug(f"{os.path.basename(output_file)}: {progress.get('out_time')} at {progress.get('speed')}")
+
+        process.wait()
+        if timer:
+            timer.cancel()
+        stderr_reader.join()
+
+        if timed_out.is_set():
+            logger.error(f"Merging {output_file} timed out after {self.timeout} seconds")
+            return False
+        if process.returncode != 0:
+            logger.error(f"Error merging files: {''.join(stderr_tail).strip()}")
+            return False
+        return True
+
+    def _get_priority_prefix(self):
+        prefix = []
+        if self.ionice_args:
+            if shutil.which('ionice'):
+                prefix += ['ionice'] + self.ionice_args
+            else:
+                logger.debug("ionice is not available, ignoring IO priority")
+        if self.nice is not None:
+            if shutil.which('nice'):
+                prefix += ['nice', '-n', str(self.nice)]
+            else:
+                logger.debug("nice is not available, ignoring CPU priority")
+        return prefix
@@ -0,0 +1,117 @@
+import os
+import time
+import errno
+import atexit
+import shutil
+import socket
+import hashlib
+from urllib.parse import urlsplit
+
+from drtv_dl.logger import logger
+from drtv_dl.utils import settings
+
+# scratch directories are named after the owning process so orphans can be told apart from live runs
+SCRATCH_PREFIX = '.drtv-dl-'
+# partial ranged downloads outlive their process so a later run can resume them
+RESUME_DIRNAME = '.drtv-dl.resume'
+RESUME_MAX_AGE = 7 * 24 * 3600
+
+_scratch_dirs = {}
+_resume_dirs = {}
+
+def get_scratch_dir(directory=None):
+    directory = directory or settings.get_temp_dir()
+    if directory not in _scratch_dirs:
+        os.makedirs(directory, exist_ok=True)
+        cleanup_orphaned_scratch_dirs(directory)
+        scratch_dir = os.path.join(directory, _scratch_name())
+        os.makedirs(scratch_dir, exist_ok=True)
+        if not _scratch_dirs:
+            atexit.register(remove_scratch_dirs)
+        _scratch_dirs[directory] = scratch_dir
+    return _scratch_dirs[directory]
+
+def remove_scratch_dirs():
+    while _scratch_dirs:
+        _, scratch_dir = _scratch_dirs.popitem()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+def cleanup_orphaned_scratch_dirs(directory):
+    hostname = socket.gethostname()
+    for entry in os.listdir(directory):
+        if not entry.startswith(SCRATCH_PREFIX):
+            continue
+        pid, _, owner = entry[len(SCRATCH_PREFIX):].partition('-')
+        if owner != hostname or not pid.isdigit() or _is_process_alive(int(pid)):
+            continue
+        logger.info(f"Removing orphaned temporary files in {entry}")
+        shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+def get_resume_dir(directory=None):
+    directory = directory or settings.get_temp_dir()
+    if directory not in _resume_dirs:
+        resume_dir = os.path.join(directory, RESUME_DIRNAME)
+        os.makedirs(resume_dir, exist_ok=True)
+        cleanup_stale_resume_files(resume_dir)
+        _resume_dirs[directory] = resume_dir
+    return _resume_dirs[directory]
+
+def get_resume_filename(url, size, directory=None):
+    # signed query strings change between extractions, the path and size identify the track
+    parts = urlsplit(url)
+    key = hashlib.sha1(f"{parts.netloc}{parts.path}".encode('utf-8')).hexdigest()
+    return os.path.join(get_resume_dir(directory), f"{key}-{size}.part")
+
+def cleanup_stale_resume_files(resume_dir):
+    cutoff = time.time() - RESUME_MAX_AGE
+    for entry in os.listdir(resume_dir):
+        path = os.path.join(resume_dir, entry)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                logger.info(f"Removing stale partial download {entry}")
+                os.remove(path)
+        except OSError:
+            continue
+
+def finalize_file(source, destination):
+    destination_dir = os.path.dirname(os.path.abspath(destination))
+    os.makedirs(destination_dir, exist_ok=True)
+    try:
+        os.replace(source, destination)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    # different filesystems: stream into a staging file next to the destination, then rename
+    staging_file = os.path.join(get_scratch_dir(destination_dir), os.path.basename(destination))
+    logger.debug(f"Copying {source} to {destination} across filesystems")
+    try:
+        shutil.copyfile(source, staging_file)
+        os.replace(staging_file, destination)
+    finally:
+        if os.path.exists(staging_file):
+            os.remove(staging_file)
+    os.remove(source)
+
+def preallocate(file, size):
+    if not size or not hasattr(os, 'posix_fallocate'):
+        return False
+    try:
+        os.posix_fallocate(file if isinstance(file, int) else file.fileno(), 0, size)
+        return True
+    except OSError as e:
+        logger.debug(f"Preallocation not supported: {e}")
+        return False
+
+def _scratch_name():
+    return f"{SCRATCH_PREFIX}{os.getpid()}-{socket.gethostname()}"
+
+def _is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
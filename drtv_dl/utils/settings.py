@@ -1,5 +1,15 @@
+import os
+
 SUPPRESS_OUTPUT = False
 PROXY = None
+TEMP_DIR = None
+OUTPUT_DIR = None
+VERIFY_LEVEL = 'fast'
+DOWNLOAD_CONNECTIONS = 1
+MERGE_WORKERS = None
+MERGE_NICE = None
+MERGE_IONICE = None
+MERGE_TIMEOUT = None
 
 def set_suppress_output(suppress):
     global SUPPRESS_OUTPUT
@@ -19,4 +29,33 @@ def set_proxy(proxy):
         PROXY = {
             'http': f'http://{proxy}',
             'https': f'http://{proxy}'
-        }
\ No newline at end of file
+        }
+
+def set_temp_dir(temp_dir):
+    global TEMP_DIR
+    TEMP_DIR = os.path.abspath(temp_dir)
+
+def set_output_dir(output_dir):
+    global OUTPUT_DIR
+    OUTPUT_DIR = os.path.abspath(output_dir)
+
+def set_verify_level(level):
+    global VERIFY_LEVEL
+    VERIFY_LEVEL = level
+
+def set_download_connections(connections):
+    global DOWNLOAD_CONNECTIONS
+    DOWNLOAD_CONNECTIONS = max(1, connections)
+
+def set_merge_options(workers=None, nice=None, ionice=None, timeout=None):
+    global MERGE_WORKERS, MERGE_NICE, MERGE_IONICE, MERGE_TIMEOUT
+    MERGE_WORKERS = workers
+    MERGE_NICE = nice
+    MERGE_IONICE = ionice
+    MERGE_TIMEOUT = timeout
+
+def get_output_dir():
+    return OUTPUT_DIR or os.getcwd()
+
+def get_temp_dir():
+    return TEMP_DIR or get_output_dir()
\ No newline at end of file
@@ -0,0 +1,160 @@
+import os
+import json
+import struct
+import threading
+import ffmpeg
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from drtv_dl.logger import logger
+
+class Verifier:
+    LEVELS = ('none', 'fast', 'deep')
+    RECORD_FILENAME = '.drtv-dl.verified.json'
+    DURATION_TOLERANCE = 2.0
+    _record_lock = threading.Lock()
+
+    def __init__(self, level='fast'):
+        if level not in self.LEVELS:
+            raise ValueError(f"Unknown verification level: {level}")
+        self.level = level
+
+    def verify_track(self, filename, track, expected_duration=None):
+        if self.level == 'none':
+            return True
+        if not self._check_size(filename, track.get('size')):
+            return False
+        if not self.check_mp4_boxes(filename):
+            return False
+        if self.level == 'deep':
+            return self._check_duration(filename, expected_duration)
+        return True
+
+    def verify_output(self, filename, expected_duration=None):
+        if self.level == 'none':
+            return True
+        if not self.check_mp4_boxes(filename):
+            return False
+        if self.level == 'deep':
+            return self._check_duration(filename, expected_duration)
+        return True
+
+    def is_trusted(self, filename):
+        entry = self._load_records(filename).get(os.path.basename(filename))
+        if not entry:
+            return False
+        stat = os.stat(filename)
+        return (
+            entry['size'] == stat.st_size
+            and entry['mtime_ns'] == stat.st_mtime_ns
+            and self.LEVELS.index(entry['level']) >= self.LEVELS.index(self.level)
+        )
+
+    def record(self, filename):
+        if self.level == 'none':
+            return
+        stat = os.stat(filename)
+        record_path = self._get_record_path(filename)
+        with self._lock_records(record_path):
+            records = self._load_records(filename)
+            records[os.path.basename(filename)] = {
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'level': self.level,
+            }
+            temp_path = f"{record_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump(records, file, indent=2)
+            os.replace(temp_path, record_path)
+
+    @staticmethod
+    def check_mp4_boxes(filename):
+        # walks the top-level boxes by their headers only, payloads are never read
+        file_size = os.path.getsize(filename)
+        box_types = set()
+        offset = 0
+        with open(filename, 'rb') as file:
+            while offset < file_size:
+                file.seek(offset)
+                header = file.read(8)
+                if len(header) < 8:
+                    logger.warning(f"{filename}: Truncated box header at offset {offset}")
+                    return False
+                box_size, box_type = struct.unpack('>I4s', header)
+                if box_size == 1:
+                    large_size = file.read(8)
+                    if len(large_size) < 8:
+                        logger.warning(f"{filename}: Truncated box header at offset {offset}")
+                        return False
+                    box_size = struct.unpack('>Q', large_size)[0]
+                elif box_size == 0:
+                    box_size = file_size - offset
+                if box_size < 8:
+                    logger.warning(f"{filename}: Invalid box size {box_size} at offset {offset}")
+                    return False
+                box_types.add(box_type)
+                offset += box_size
+
+        if offset != file_size:
+            logger.warning(f"{filename}: Last box ends at {offset} but file is {file_size} bytes")
+            return False
+        if b'ftyp' not in box_types or b'moov' not in box_types:
+            logger.warning(f"{filename}: Missing ftyp or moov box")
+            return False
+        return True
+
+    @staticmethod
+    def probe_duration(filename):
+        try:
+            return float(ffmpeg.probe(filename)['format']['duration'])
+        except (ffmpeg.Error, KeyError, ValueError) as e:
+            logger.warning(f"{filename}: Could not probe duration: {e}")
+            return None
+
+    @staticmethod
+    def _check_size(filename, expected_size):
+        if expected_size is None:
+            return True
+        size = os.path.getsize(filename)
+        if size != expected_size:
+            logger.warning(f"{filename}: Expected {expected_size} bytes but got {size}")
+            return False
+        return True
+
+    def _check_duration(self, filename, expected_duration):
+        if not expected_duration:
+            logger.debug(f"{filename}: No expected duration to check against")
+            return True
+        duration = self.probe_duration(filename)
+        if duration is None:
+            return False
+        if abs(duration - float(expected_duration)) > max(self.DURATION_TOLERANCE, float(expected_duration) * 0.01):
+            logger.warning(f"{filename}: Duration is {duration:.1f}s but {expected_duration}s was expected")
+            return False
+        return True
+
+    @contextmanager
+    def _lock_records(self, record_path):
+        # the record file itself is swapped out by os.replace, so the lock lives in a file of its own
+        with self._record_lock, open(f"{record_path}.lock", 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _get_record_path(self, filename):
+        return os.path.join(os.path.dirname(os.path.abspath(filename)), self.RECORD_FILENAME)
+
+    def _load_records(self, filename):
+        try:
+            with open(self._get_record_path(filename), 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
@@ -0,0 +1,139 @@
+import os
+import struct
+import threading
+
+from drtv_dl.logger import logger
+from drtv_dl.utils.scratch import preallocate
+
+def release_page_cache(fd):
+    # written pages are clean after the sync, so dropping them does not lose data
+    if hasattr(os, 'fdatasync'):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+class ExtentBitmap:
+    HEADER = struct.Struct('>QI')
+
+    def __init__(self, size, block_size, bits=None):
+        self.size = size
+        self.block_size = block_size
+        self.block_count = (size + block_size - 1) // block_size
+        self.bits = bits if bits is not None else bytearray((self.block_count + 7) // 8)
+
+    def mark(self, start, end):
+        # start must be block aligned; only the block holding the end of the file may be partial
+        first_block = start // self.block_size
+        last_block = self.block_count if end >= self.size else end // self.block_size
+        for block in range(first_block, last_block):
+            self.bits[block >> 3] |= 1 << (block & 7)
+
+    def is_set(self, block):
+        return bool(self.bits[block >> 3] & (1 << (block & 7)))
+
+    def is_complete(self):
+        return all(self.is_set(block) for block in range(self.block_count))
+
+    def missing_ranges(self):
+        ranges = []
+        start = None
+        for block in range(self.block_count):
+            if not self.is_set(block):
+                if start is None:
+                    start = block * self.block_size
+            elif start is not None:
+                ranges.append((start, block * self.block_size))
+                start = None
+        if start is not None:
+            ranges.append((start, self.size))
+        return ranges
+
+    def missing_bytes(self):
+        return sum(end - start for start, end in self.missing_ranges())
+
+    def to_bytes(self):
+        return self.HEADER.pack(self.size, self.block_size) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        size, block_size = cls.HEADER.unpack_from(data)
+        return cls(size, block_size, bytearray(data[cls.HEADER.size:]))
+
+
+class ParallelFileWriter:
+    BLOCK_SIZE = 1024 * 1024
+    SYNC_INTERVAL = 64 * 1024 * 1024
+
+    def __init__(self, filename, size, block_size=BLOCK_SIZE, sync_interval=SYNC_INTERVAL):
+        self.filename = filename
+        self.size = size
+        self.sync_interval = sync_interval
+        self.extents_filename = f"{filename}.extents"
+        self.extents = self._load_extents(block_size)
+        self.block_size = self.extents.block_size
+        self._fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+        preallocate(self._fd, size)
+        os.ftruncate(self._fd, size)
+        # only the bitmap and the sync counter are shared, the data writes themselves never lock
+        self._lock = threading.Lock()
+        self._unsynced = 0
+
+    def write_at(self, offset, data):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self._fd, view, offset)
+            offset += written
+            view = view[written:]
+        return len(data)
+
+    def mark_complete(self, start, end):
+        with self._lock:
+            self.extents.mark(start, end)
+            self._unsynced += end - start
+            should_sync = self._unsynced >= self.sync_interval
+            if should_sync:
+                self._unsynced = 0
+        if should_sync:
+            self._release_page_cache()
+
+    def is_complete(self):
+        with self._lock:
+            return self.extents.is_complete()
+
+    def missing_ranges(self):
+        with self._lock:
+            return self.extents.missing_ranges()
+
+    def missing_bytes(self):
+        with self._lock:
+            return self.extents.missing_bytes()
+
+    def close(self):
+        self._release_page_cache()
+        os.close(self._fd)
+        if self.extents.is_complete():
+            if os.path.exists(self.extents_filename):
+                os.remove(self.extents_filename)
+        else:
+            self._save_extents()
+
+    def _release_page_cache(self):
+        release_page_cache(self._fd)
+
+    def _load_extents(self, block_size):
+        try:
+            with open(self.extents_filename, 'rb') as file:
+                extents = ExtentBitmap.from_bytes(file.read())
+        except (OSError, struct.error):
+            return ExtentBitmap(self.size, block_size)
+        if extents.size != self.size or not os.path.exists(self.filename):
+            return ExtentBitmap(self.size, block_size)
+        logger.debug(f"{self.filename}: Resuming with {extents.missing_bytes()} bytes missing")
+        return extents
+
+    def _save_extents(self):
+        with open(self.extents_filename, 'wb') as file:
+            file.write(self.extents.to_bytes())
@@ -0,0 +1,131 @@
+import json
+import time
+import requests
+from collections import deque
+
+from drtv_dl.logger import logger
+from drtv_dl.exceptions import DRTVDownloaderError, ExtractionError
+from drtv_dl.extractor import SeriesInfoExtractor
+from drtv_dl.utils.helpers import (
+    download_webpage_conditional,
+    extract_ids_from_url,
+    print_to_screen,
+)
+
+class Watcher:
+    def __init__(self, ie, sie, downloader, download_kwargs, interval=3600, max_interval=6 * 3600, backoff=2, max_attempts=3):
+        self.info_extractor = ie
+        self.season_extractor = sie
+        self.series_extractor = SeriesInfoExtractor(sie)
+        self.downloader = downloader
+        self.download_kwargs = download_kwargs
+        self.interval = interval
+        self.max_interval = max(interval, max_interval)
+        self.backoff = backoff
+        self.max_attempts = max_attempts
+
+        # state is kept in memory only, a restart begins with a full poll
+        self.validators = {}
+        self.parsed_pages = {}
+        self.known_episodes = set()
+        self.queue = deque()
+        self.attempts = {}
+
+    def run(self, url, max_polls=None):
+        current_interval = self.interval
+        polls = 0
+        while True:
+            try:
+                new_episodes = self.poll(url)
+            except (DRTVDownloaderError, requests.RequestException, ValueError) as e:
+                # a failed poll is treated like an unchanged one, the next poll tries again
+                logger.error(f"Failed to poll {url}: {e}")
+                new_episodes = []
+            self.queue.extend(new_episodes)
+            self._process_queue()
+
+            polls += 1
+            if max_polls is not None and polls >= max_polls:
+                return
+
+            if new_episodes:
+                current_interval = self.interval
+            else:
+                current_interval = min(current_interval * self.backoff, self.max_interval)
+            print_to_screen(f"Next poll in {current_interval:.0f} seconds")
+            time.sleep(current_interval)
+
+    def poll(self, url):
+        if '/drtv/serie/' in url:
+            display_id, series_id = extract_ids_from_url(url)
+            season_urls = self._poll_page(
+                self.series_extractor.SERIES_API_URL,
+                self.series_extractor.get_page_params(display_id, series_id),
+                self.series_extractor.parse_season_urls
+            )
+        else:
+            season_urls = [url]
+
+        new_episodes = []
+        for season_url in season_urls:
+            display_id, season_id = extract_ids_from_url(season_url)
+            season = self._poll_page(
+                self.season_extractor.SEASON_API_URL,
+                self.season_extractor.get_page_params(display_id, season_id),
+                self.season_extractor.parse_season_data
+            )
+            for episode_url in season['episode_urls']:
+                if episode_url not in self.known_episodes and episode_url not in new_episodes:
+                    new_episodes.append(episode_url)
+
+        # only marked as known once every page was polled, so a failed poll loses nothing
+        self.known_episodes.update(new_episodes)
+
+        if new_episodes:
+            print_to_screen(f"Found {len(new_episodes)} new episodes")
+        else:
+            logger.debug("No new episodes found")
+        return new_episodes
+
+    def _poll_page(self, api_url, params, parse):
+        key = params['path']
+        etag, last_modified = self.validators.get(key, (None, None))
+        content, etag, last_modified = download_webpage_conditional(
+            api_url,
+            etag=etag,
+            last_modified=last_modified,
+            params=params
+        )
+        if content is None and key in self.parsed_pages:
+            logger.debug(f"{key} is unchanged")
+            return self.parsed_pages[key]
+
+        # validators are only kept for pages that parsed, otherwise a 304 would leave nothing to reuse
+        try:
+            self.parsed_pages[key] = parse(json.loads(content))
+        except (ValueError, IndexError, KeyError, AttributeError, TypeError) as e:
+            raise ExtractionError(f"Unexpected page content for {key}: {e!r}") from e
+        self.validators[key] = (etag, last_modified)
+        return self.parsed_pages[key]
+
+    def _process_queue(self):
+        failed = deque()
+        while self.queue:
+            episode_url = self.queue.popleft()
+            print_to_screen(f"Processing new episode: {episode_url}")
+            try:
+                episode_info = self.info_extractor.extract(episode_url)
+                self.downloader.download(episode_info, False, **self.download_kwargs)
+            except Exception as e:
+                attempts = self.attempts.get(episode_url, 0) + 1
+                if attempts >= self.max_attempts:
+                    # the episode stays known, so later polls do not pick it up again
+                    logger.error(f"Failed to download {episode_url} after {attempts} attempts, giving up: {e}")
+                    self.attempts.pop(episode_url, None)
+                    continue
+                logger.error(f"Failed to download {episode_url}, retrying on next poll: {e}")
+                self.attempts[episode_url] = attempts
+                failed.append(episode_url)
+            else:
+                self.attempts.pop(episode_url, None)
+        self.queue.extend(failed)
@@ -0,0 +1,192 @@
+import os
+import time
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from drtv_dl.logger import logger
+from drtv_dl.utils.helpers import print_to_screen, format_size
+
+class WorkQueue:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            output TEXT,
+            bytes INTEGER,
+            error TEXT,
+            updated REAL
+        )
+    """
+
+    def __init__(self, path, lease_timeout=300, max_attempts=3):
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        with self._transaction() as conn:
+            conn.execute(self.SCHEMA)
+
+    def enqueue(self, urls):
+        now = time.time()
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (url, updated) VALUES (?, ?)",
+                [(url, now) for url in urls]
+            )
+            return conn.total_changes - before
+
+    def acquire(self, worker_id):
+        now = time.time()
+        with self._transaction() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT id, url, status, attempts FROM jobs "
+                    "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    return None
+
+                job_id, url, status, attempts = row
+                if status == 'leased':
+                    logger.warning(f"Lease on job {job_id} expired, reassigning")
+                    if attempts >= self.max_attempts:
+                        conn.execute(
+                            "UPDATE jobs SET status = 'failed', worker = NULL, lease_expires = NULL, "
+                            "error = 'lease expired', updated = ? WHERE id = ?",
+                            (now, job_id)
+                        )
+                        continue
+
+                conn.execute(
+                    "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated = ? WHERE id = ?",
+                    (worker_id, now + self.lease_timeout, now, job_id)
+                )
+                return {'id': job_id, 'url': url, 'attempt': attempts + 1}
+
+    def heartbeat(self, job_id, worker_id):
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (now + self.lease_timeout, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, output, size):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', lease_expires = NULL, output = ?, bytes = ?, "
+                "error = NULL, updated = ? WHERE id = ? AND worker = ?",
+                (output, size, time.time(), job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "worker = NULL, lease_expires = NULL, error = ?, updated = ? WHERE id = ? AND worker = ?",
+                (self.max_attempts, error, time.time(), job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def has_unfinished(self):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'leased')").fetchone()
+            return row[0] > 0
+
+    def stats(self):
+        with self._transaction() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            total_bytes = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM jobs WHERE status = 'done'").fetchone()[0]
+        return {**counts, 'bytes': total_bytes}
+
+    def print_stats(self):
+        stats = self.stats()
+        print_to_screen(
+            f"Queue: {stats.get('done', 0)} done, {stats.get('failed', 0)} failed, "
+            f"{stats.get('pending', 0)} pending, {stats.get('leased', 0)} in progress, "
+            f"{format_size(stats['bytes'])} downloaded"
+        )
+        return stats
+
+    @contextmanager
+    def _transaction(self):
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            # take the write lock up front so two workers can never lease the same job
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+
+class QueueWorker:
+    def __init__(self, queue, ie, downloader, download_kwargs, worker_id=None, poll_interval=10):
+        self.queue = queue
+        self.info_extractor = ie
+        self.downloader = downloader
+        self.download_kwargs = download_kwargs
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval
+
+    def run(self):
+        print_to_screen(f"Worker {self.worker_id} started")
+        processed = 0
+        while True:
+            job = self.queue.acquire(self.worker_id)
+            if job is None:
+                # leased jobs may still come back if their worker dies
+                if not self.queue.has_unfinished():
+                    break
+                time.sleep(self.poll_interval)
+                continue
+
+            self._process(job)
+            processed += 1
+
+        print_to_screen(f"Worker {self.worker_id} finished after {processed} jobs")
+        self.queue.print_stats()
+        return processed
+
+    def _process(self, job):
+        print_to_screen(f"Processing job {job['id']} (attempt {job['attempt']}): {job['url']}")
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job['id'], stop_heartbeat), daemon=True)
+        heartbeat.start()
+        try:
+            episode_info = self.info_extractor.extract(job['url'])
+            output_filename = self.downloader.download(episode_info, False, **self.download_kwargs)
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {e}")
+            self.queue.fail(job['id'], self.worker_id, str(e))
+            return
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+
+        output_filenames = output_filename if isinstance(output_filename, list) else [output_filename]
+        size = sum(os.path.getsize(filename) for filename in output_filenames if filename and os.path.exists(filename))
+        if not self.queue.complete(job['id'], self.worker_id, ', '.join(output_filenames), size):
+            logger.warning(f"Job {job['id']} finished after its lease was reassigned")
+
+    def _heartbeat(self, job_id, stop_event):
+        while not stop_event.wait(self.queue.lease_timeout / 3):
+            if not self.queue.heartbeat(job_id, self.worker_id):
+                logger.warning(f"Lost lease on job {job_id}")
+                return